@@ -160,6 +160,9 @@ parser.add_argument(
     help="The output directory where the model predictions \
                     and checkpoints will be written.",
 )
+parser.add_argument(
+    "--use_cache", action='store_true', help="Whether to cache preprocessed data",
+)
 parser.add_argument(
     "--save_epoch_freq",
     default=1,
@@ -274,6 +277,7 @@ def create_pipeline(
         data_dir=args.data_dir,
         max_seq_length=max_seq_length,
         token_params=token_params,
+        use_cache=args.use_cache,
     )
 
     input_ids, input_type_ids, input_mask, labels = data_layer()
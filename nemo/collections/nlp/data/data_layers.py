@@ -1074,6 +1074,7 @@ class GlueDataLayerClassification(TextDataLayer):
         num_samples=-1,
         shuffle=False,
         batch_size=64,
+        use_cache=False,
         dataset_type=GLUEDataset,
         **kwargs
     ):
@@ -1086,6 +1087,7 @@ class GlueDataLayerClassification(TextDataLayer):
             'token_params': token_params,
             'tokenizer': tokenizer,
             'max_seq_length': max_seq_length,
+            'use_cache': use_cache,
         }
 
         super().__init__(dataset_type, dataset_params, **kwargs)
@@ -1143,6 +1145,7 @@ class GlueDataLayerRegression(TextDataLayer):
         num_samples=-1,
         shuffle=False,
         batch_size=64,
+        use_cache=False,
         dataset_type=GLUEDataset,
         **kwargs
     ):
@@ -1155,6 +1158,7 @@ class GlueDataLayerRegression(TextDataLayer):
             'token_params': token_params,
             'tokenizer': tokenizer,
             'max_seq_length': max_seq_length,
+            'use_cache': use_cache,
         }
 
         super().__init__(dataset_type, dataset_params, **kwargs)
@@ -20,34 +20,181 @@ Some transformer of this code were adapted from the HuggingFace library at
 https://github.com/huggingface/transformers
 """
 
+import hashlib
+import inspect
+import multiprocessing
+import os
+from collections import OrderedDict
+
 import numpy as np
+import torch
 from torch.utils.data import Dataset
 
 import nemo
 
+try:
+    from numba import njit
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# Maximum number of distinct texts whose tokenization is memoized
+# by convert_examples_to_features
+TOKENIZER_CACHE_SIZE = 200000
+# Number of examples whose texts are tokenized with one batched call
+TOKENIZER_BATCH_SIZE = 10000
+# Smallest number of examples converted with multiple worker processes
+MIN_EXAMPLES_FOR_MULTIPROCESSING = 20000
+# Arrays returned by convert_examples_to_features, in order
+FEATURE_NAMES = ('input_ids', 'segment_ids', 'input_mask', 'label_ids')
+# Token and segment ids are stored with the narrowest of these dtypes
+# that fits the vocabulary, the mask is stored as bytes. Models cast
+# them to int64 before the embedding lookup.
+IDS_DTYPES = (np.int16, np.int32, np.int64)
+MASK_DTYPE = np.uint8
+
 
 class GLUEDataset(Dataset):
+    """
+    Creates GLUE dataset for sentence (pair) classification and regression.
+
+    Args:
+        data_dir (str): directory that contains the .tsv files of the task
+        tokenizer (TokenizerSpec): tokenizer object
+        max_seq_length (int): length to which all sequences are padded
+            or truncated
+        processor (DataProcessor): processor of the GLUE task
+        output_mode (str): "classification" or "regression"
+        evaluate (bool): use the dev split instead of the train split
+        token_params (dict): special tokens passed to
+            convert_examples_to_features
+        use_cache (bool): save the features to data_dir and reuse them
+            when the dataset is created again with the same parameters
+    """
+
     def __init__(
-        self, data_dir, tokenizer, max_seq_length, processor, output_mode, evaluate, token_params,
+        self, data_dir, tokenizer, max_seq_length, processor, output_mode, evaluate, token_params, use_cache=False,
     ):
         self.tokenizer = tokenizer
         self.label_list = processor.get_labels()
-        self.examples = processor.get_dev_examples(data_dir) if evaluate else processor.get_train_examples(data_dir)
-        self.features = convert_examples_to_features(
-            self.examples, self.label_list, max_seq_length, tokenizer, output_mode, **token_params
-        )
+        # Examples are only needed for the conversion, they are not kept, so
+        # that forked data loader workers don't touch their reference counts
+        examples = processor.get_dev_examples(data_dir) if evaluate else processor.get_train_examples(data_dir)
+
+        features = None
+        cached_features = None
+        if use_cache:
+            cache_key = _get_features_cache_key(
+                examples, self.label_list, max_seq_length, tokenizer, processor, output_mode, token_params
+            )
+            cached_features_prefix = os.path.join(data_dir, f'cache_glue_{cache_key}')
+            master_device = not torch.distributed.is_initialized() or torch.distributed.get_rank() == 0
+            if master_device and not _features_cache_exists(cached_features_prefix):
+                features = convert_examples_to_features(
+                    examples, self.label_list, max_seq_length, tokenizer, output_mode, **token_params
+                )
+                nemo.logging.info("Saving features into cached files %s_*.npy", cached_features_prefix)
+                try:
+                    _save_features(cached_features_prefix, features)
+                except OSError as e:
+                    # The other ranks are waiting at the barrier, they
+                    # convert the examples themselves if the cache is missing
+                    nemo.logging.warning("Features are not cached, failed to save them: %s", e)
+            if torch.distributed.is_initialized():
+                torch.distributed.barrier()
+            if _features_cache_exists(cached_features_prefix):
+                nemo.logging.info("Loading features from cached files %s_*.npy", cached_features_prefix)
+                cached_features = _load_features(cached_features_prefix)
+
+        if cached_features is not None:
+            # memory mapped cache files are already shared between processes
+            features = [torch.from_numpy(array) for array in cached_features]
+        else:
+            if features is None:
+                features = convert_examples_to_features(
+                    examples, self.label_list, max_seq_length, tokenizer, output_mode, **token_params
+                )
+            # Features are moved to shared memory, so that data loader workers
+            # (including spawned ones) receive handles instead of copies
+            features = [torch.from_numpy(array).share_memory_() for array in features]
+        self.input_ids, self.segment_ids, self.input_mask, self.label_ids = features
 
     def __len__(self):
-        return len(self.features)
+        return len(self.input_ids)
 
     def __getitem__(self, idx):
-        feature = self.features[idx]
-        return (
-            np.array(feature.input_ids),
-            np.array(feature.segment_ids),
-            np.array(feature.input_mask, dtype=np.long),
-            np.array(feature.label_id),
-        )
+        # rows are returned as tensor views, which the default collate
+        # function stacks without any intermediate copies
+        return self.input_ids[idx], self.segment_ids[idx], self.input_mask[idx], self.label_ids[idx]
+
+
+def _get_features_cache_key(examples, label_list, max_seq_length, tokenizer, processor, output_mode, token_params):
+    """Returns a hash of everything the output of convert_examples_to_features
+    depends on. The tokenizer is identified by its type, its whole vocabulary,
+    the ids of the special tokens and the token ids it produces for the first
+    examples.
+    """
+    key = hashlib.sha1()
+    defaults = inspect.signature(convert_examples_to_features).parameters
+    special_tokens = [
+        token_params.get(name, defaults[name].default)
+        for name in ('pad_token', 'bos_token', 'eos_token', 'cls_token', 'sep_token_extra')
+    ]
+    params = (
+        type(processor).__name__,
+        type(tokenizer).__name__,
+        tokenizer.vocab_size,
+        np.dtype(_get_ids_dtype(tokenizer.vocab_size)).str,
+        np.dtype(MASK_DTYPE).str,
+        label_list,
+        max_seq_length,
+        output_mode,
+        sorted(token_params.items()),
+        tokenizer.tokens_to_ids([token for token in special_tokens if token]),
+    )
+    key.update(repr(params).encode('utf-8'))
+    key.update(repr(tokenizer.ids_to_tokens(list(range(tokenizer.vocab_size)))).encode('utf-8'))
+    for example in examples[:100]:
+        key.update(repr(tokenizer.text_to_ids(example.text_a)).encode('utf-8'))
+    for example in examples:
+        key.update(repr((example.text_a, example.text_b, example.label)).encode('utf-8'))
+    return key.hexdigest()
+
+
+def _get_ids_dtype(vocab_size):
+    return next(dtype for dtype in IDS_DTYPES if vocab_size <= np.iinfo(dtype).max)
+
+
+def _features_cache_exists(prefix):
+    return all(os.path.exists(f'{prefix}_{name}.npy') for name in FEATURE_NAMES)
+
+
+def _save_features(prefix, features):
+    # Arrays are written to temporary files first, so that other processes
+    # never load partially written files
+    for name, array in zip(FEATURE_NAMES, features):
+        path = f'{prefix}_{name}.npy'
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+        finally:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+
+
+def _load_features(prefix):
+    # Copy-on-write memory maps avoid reading the whole cache into memory
+    # and let data loader workers share the pages, while keeping the arrays
+    # writable as expected by torch.from_numpy
+    return tuple(np.load(f'{prefix}_{name}.npy', mmap_mode='c') for name in FEATURE_NAMES)
 
 
 def convert_examples_to_features(
@@ -68,8 +215,14 @@ def convert_examples_to_features(
     mask_padding_with_zero=True,
     sequence_a_segment_id=0,
     sequence_b_segment_id=1,
+    num_workers=None,
 ):
-    """ Loads a data file into a list of `InputBatch`s
+    """ Converts examples into padded feature arrays of shape
+        [len(examples), max_seq_length]: input_ids, segment_ids, input_mask
+        and a label array of shape [len(examples)]
+        Large example lists are split between `num_workers` processes
+        where fork is available (defaults to the number of CPUs available
+        to the master process, other ranks of distributed jobs use 1).
         `cls_token_at_end` define the location of the CLS token:
             - False (Default, BERT/XLM pattern): [CLS] + A + [SEP] + B + [SEP]
             - True (XLNet/GPT pattern): A + [SEP] + B + [SEP] + [CLS]
@@ -100,130 +253,346 @@ def convert_examples_to_features(
           tokens:   <BOS> the dog is hairy . <EOS>
           type_ids:   0   0   0   0  0     0   0
     """
-    label_map = {label: i for i, label in enumerate(label_list)}
+    token_params = {
+        'bos_token': bos_token,
+        'eos_token': eos_token,
+        'pad_token': pad_token,
+        'cls_token': cls_token,
+        'sep_token_extra': sep_token_extra,
+        'cls_token_at_end': cls_token_at_end,
+        'cls_token_segment_id': cls_token_segment_id,
+        'pad_token_segment_id': pad_token_segment_id,
+        'pad_on_left': pad_on_left,
+        'mask_padding_with_zero': mask_padding_with_zero,
+        'sequence_a_segment_id': sequence_a_segment_id,
+        'sequence_b_segment_id': sequence_b_segment_id,
+    }
+    # This also loads the numba kernels before any worker processes are
+    # forked, so that they don't load them again. The kernels are compiled
+    # once and then read from numba's on-disk cache by later runs and ranks
+    _log_examples(examples[:5], label_list, max_seq_length, tokenizer, output_mode, token_params)
+
+    if num_workers is None:
+        # Only the master process forks workers, so that the ranks of a
+        # distributed job don't each start a worker per CPU
+        if torch.distributed.is_initialized() and torch.distributed.get_rank() != 0:
+            num_workers = 1
+        else:
+            num_workers = _get_num_cpus()
+    if (
+        num_workers > 1
+        and len(examples) >= MIN_EXAMPLES_FOR_MULTIPROCESSING
+        and 'fork' in multiprocessing.get_all_start_methods()
+        and not multiprocessing.current_process().daemon
+    ):
+        return _convert_examples_to_features_parallel(
+            examples, label_list, max_seq_length, tokenizer, output_mode, token_params, num_workers
+        )
+    return _convert_examples_to_features(examples, label_list, max_seq_length, tokenizer, output_mode, **token_params)
 
-    features = []
+
+def _get_num_cpus():
+    # CPUs the process may run on, which is fewer than the CPUs of the
+    # machine when it is restricted with taskset or a container cpuset
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _log_examples(examples, label_list, max_seq_length, tokenizer, output_mode, token_params):
+    """Logs the features of a few examples for debugging. They are converted
+    separately, so the main conversion only works with ids and shows the
+    examples before it starts.
+    """
+    input_ids, segment_ids, input_mask, label_ids = _convert_examples_to_features(
+        examples, label_list, max_seq_length, tokenizer, output_mode, **token_params, log_progress=False
+    )
+    mask_value = 1 if token_params['mask_padding_with_zero'] else 0
     for ex_index, example in enumerate(examples):
-        if ex_index % 10000 == 0:
-            nemo.logging.info("Writing example %d of %d" % (ex_index, len(examples)))
+        tokens = tokenizer.ids_to_tokens(input_ids[ex_index][input_mask[ex_index] == mask_value].tolist())
+        nemo.logging.info("*** Example ***")
+        nemo.logging.info("guid: %s", example.guid)
+        nemo.logging.info("tokens: %s", " ".join(list(map(str, tokens))))
+        nemo.logging.info("input_ids: %s", " ".join(list(map(str, input_ids[ex_index]))))
+        nemo.logging.info("input_mask: %s", " ".join(list(map(str, input_mask[ex_index]))))
+        nemo.logging.info("segment_ids: %s", " ".join(list(map(str, segment_ids[ex_index]))))
+        nemo.logging.info("label: %s (id = %d)", example.label, label_ids[ex_index])
 
-        tokens_a = tokenizer.text_to_tokens(example.text_a)
 
-        tokens_b = None
-        if example.text_b:
-            tokens_b = tokenizer.text_to_tokens(example.text_b)
+# Arguments of _convert_examples_to_features_parallel, inherited by the
+# forked worker processes instead of being pickled for every chunk
+_worker_args = None
 
-            special_tokens_count = 2 if eos_token else 0
-            special_tokens_count += 1 if sep_token_extra else 0
-            special_tokens_count += 2 if bos_token else 0
-            special_tokens_count += 1 if cls_token else 0
-            _truncate_seq_pair(tokens_a, tokens_b, max_seq_length - special_tokens_count)
-        else:
-            special_tokens_count = 1 if eos_token else 0
-            special_tokens_count += 1 if sep_token_extra else 0
-            special_tokens_count += 1 if bos_token else 0
-            if len(tokens_a) > max_seq_length - special_tokens_count:
-                tokens_a = tokens_a[: max_seq_length - special_tokens_count]
-        # Add special tokens to sequence_a
-        tokens = tokens_a
-        if bos_token:
-            tokens = [bos_token] + tokens
-        if eos_token:
-            tokens += [eos_token]
-        segment_ids = [sequence_a_segment_id] * len(tokens)
-
-        # Add sequence separator between sequences
-        if tokens_b and sep_token_extra:
-            tokens += [sep_token_extra]
-            segment_ids += [sequence_a_segment_id]
-
-        # Add special tokens to sequence_b
-        if tokens_b:
-            if bos_token:
-                tokens += [bos_token]
-                segment_ids += [sequence_b_segment_id]
-            tokens += tokens_b
-            segment_ids += [sequence_b_segment_id] * (len(tokens_b))
-            if eos_token:
-                tokens += [eos_token]
-                segment_ids += [sequence_b_segment_id]
-
-        # Add classification token - for BERT models
-        if cls_token:
-            if cls_token_at_end:
-                tokens += [cls_token]
-                segment_ids += [cls_token_segment_id]
-            else:
-                tokens = [cls_token] + tokens
-                segment_ids = [cls_token_segment_id] + segment_ids
-        input_ids = tokenizer.tokens_to_ids(tokens)
-
-        # The mask has 1 for real tokens and 0 for padding tokens. Only real
-        # tokens are attended to.
-        input_mask = [1 if mask_padding_with_zero else 0] * len(input_ids)
-
-        # Zero-pad up to the sequence length.
-        padding_length = max_seq_length - len(input_ids)
-        pad_token_id = tokenizer.tokens_to_ids([pad_token])[0]
-        if pad_on_left:
-            input_ids = ([pad_token_id] * padding_length) + input_ids
-            input_mask = ([0 if mask_padding_with_zero else 1] * padding_length) + input_mask
-            segment_ids = ([pad_token_segment_id] * padding_length) + segment_ids
-        else:
-            input_ids = input_ids + ([pad_token_id] * padding_length)
-            input_mask = input_mask + ([0 if mask_padding_with_zero else 1] * padding_length)
-            segment_ids = segment_ids + ([pad_token_segment_id] * padding_length)
-        if len(input_ids) != max_seq_length:
-            raise ValueError("input_ids must be of length max_seq_length")
-        if len(input_mask) != max_seq_length:
-            raise ValueError("input_mask must be of length max_seq_length")
-        if len(segment_ids) != max_seq_length:
-            raise ValueError("segment_ids must be of length max_seq_length")
-        if output_mode == "classification":
-            label_id = label_map[example.label]
-        elif output_mode == "regression":
-            label_id = np.float32(example.label)
-        else:
-            raise KeyError(output_mode)
-
-        if ex_index < 5:
-            nemo.logging.info("*** Example ***")
-            nemo.logging.info("guid: %s" % (example.guid))
-            nemo.logging.info("tokens: %s" % " ".join(list(map(str, tokens))))
-            nemo.logging.info("input_ids: %s" % " ".join(list(map(str, input_ids))))
-            nemo.logging.info("input_mask: %s" % " ".join(list(map(str, input_mask))))
-            nemo.logging.info("segment_ids: %s" % " ".join(list(map(str, segment_ids))))
-            nemo.logging.info("label: %s (id = %d)" % (example.label, label_id))
-
-        features.append(
-            InputFeatures(input_ids=input_ids, input_mask=input_mask, segment_ids=segment_ids, label_id=label_id,)
+
+def _convert_examples_to_features_parallel(
+    examples, label_list, max_seq_length, tokenizer, output_mode, token_params, num_workers
+):
+    global _worker_args
+
+    n_examples = len(examples)
+    chunk_size = (n_examples + num_workers - 1) // num_workers
+    chunk_starts = list(range(0, n_examples, chunk_size))
+    _worker_args = (examples, chunk_size, label_list, max_seq_length, tokenizer, output_mode, token_params)
+    try:
+        chunks = {}
+        num_converted = 0
+        with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+            for chunk_start, chunk_features in pool.imap_unordered(_convert_examples_chunk, chunk_starts):
+                chunks[chunk_start] = chunk_features
+                num_converted += len(chunk_features[0])
+                nemo.logging.info("Converted %d of %d examples", num_converted, n_examples)
+    finally:
+        _worker_args = None
+
+    return tuple(np.concatenate([chunks[start][i] for start in chunk_starts]) for i in range(len(FEATURE_NAMES)))
+
+
+def _convert_examples_chunk(chunk_start):
+    examples, chunk_size, label_list, max_seq_length, tokenizer, output_mode, token_params = _worker_args
+    chunk = examples[chunk_start : chunk_start + chunk_size]
+    features = _convert_examples_to_features(
+        chunk, label_list, max_seq_length, tokenizer, output_mode, **token_params, log_progress=False
+    )
+    return chunk_start, features
+
+
+def _convert_examples_to_features(
+    examples,
+    label_list,
+    max_seq_length,
+    tokenizer,
+    output_mode,
+    bos_token,
+    eos_token,
+    pad_token,
+    cls_token,
+    sep_token_extra,
+    cls_token_at_end,
+    cls_token_segment_id,
+    pad_token_segment_id,
+    pad_on_left,
+    mask_padding_with_zero,
+    sequence_a_segment_id,
+    sequence_b_segment_id,
+    log_progress=True,
+):
+    # Buffers are pre-filled with padding values, so only the real tokens of
+    # each example need to be written
+    n_examples = len(examples)
+    ids_dtype = _get_ids_dtype(tokenizer.vocab_size)
+
+    # Ids of all special tokens are looked up once with a single call.
+    # Unused special tokens get id -1, which _build_features skips
+    special_tokens = (pad_token, bos_token, eos_token, cls_token, sep_token_extra)
+    special_ids = iter(tokenizer.tokens_to_ids([token for token in special_tokens if token]))
+    pad_token_id, bos_id, eos_id, cls_id, sep_extra_id = [
+        next(special_ids) if token else -1 for token in special_tokens
+    ]
+
+    all_input_ids = np.full((n_examples, max_seq_length), pad_token_id, dtype=ids_dtype)
+    all_segment_ids = np.full((n_examples, max_seq_length), pad_token_segment_id, dtype=ids_dtype)
+    all_input_mask = np.full((n_examples, max_seq_length), 0 if mask_padding_with_zero else 1, dtype=MASK_DTYPE)
+    all_label_ids = _build_labels(examples, label_list, output_mode)
+
+    pair_special_tokens_count = (2 if eos_token else 0) + (2 if bos_token else 0)
+    pair_special_tokens_count += (1 if sep_token_extra else 0) + (1 if cls_token else 0)
+    # sep_token_extra is not added to single sequences, but keeping room for
+    # it preserves the truncation of the earlier implementation
+    single_special_tokens_count = (1 if eos_token else 0) + (1 if bos_token else 0)
+    single_special_tokens_count += 1 if sep_token_extra or cls_token else 0
+    if max_seq_length < single_special_tokens_count:
+        raise ValueError(
+            f"max_seq_length={max_seq_length} leaves no room for the {single_special_tokens_count} special tokens "
+            f"of single sequences"
+        )
+    if max_seq_length < pair_special_tokens_count and any(example.text_b for example in examples):
+        raise ValueError(
+            f"max_seq_length={max_seq_length} leaves no room for the {pair_special_tokens_count} special tokens "
+            f"of sequence pairs"
         )
-    return features
 
+    # GLUE tasks often repeat sentences across examples (e.g. MNLI premises),
+    # so tokenization results are memoized in a bounded LRU cache which is
+    # filled with one batched tokenizer call per TOKENIZER_BATCH_SIZE examples
+    ids_cache = OrderedDict()
+    empty_ids = np.zeros(0, dtype=ids_dtype)
 
-def _truncate_seq_pair(tokens_a, tokens_b, max_length):
-    """Truncates a sequence pair in place to the maximum length.
+    def tokenize_batch(texts):
+        for text in texts:
+            if text in ids_cache:
+                ids_cache.move_to_end(text)
+        new_texts = list(dict.fromkeys(text for text in texts if text not in ids_cache))
+        for text, ids in zip(new_texts, tokenizer.text_to_ids_batch(new_texts)):
+            ids_cache[text] = np.array(ids, dtype=ids_dtype)
+        while len(ids_cache) > TOKENIZER_CACHE_SIZE:
+            ids_cache.popitem(last=False)
 
-     This will always truncate the longer sequence one token at a time.
-     This makes more sense than truncating an equal percent
-     of tokens from each, since if one sequence is very short then each token
-     that's truncated likely contains more information than a longer sequence.
+    for batch_start in range(0, n_examples, TOKENIZER_BATCH_SIZE):
+        if log_progress:
+            nemo.logging.info("Writing example %d of %d", batch_start, n_examples)
+        batch = examples[batch_start : batch_start + TOKENIZER_BATCH_SIZE]
+        tokenize_batch([ex.text_a for ex in batch] + [ex.text_b for ex in batch if ex.text_b])
+
+        # Token ids of the batch are passed to _build_features as flat
+        # arrays with offsets, since numba can't work with ragged lists
+        ids_a = [ids_cache[ex.text_a] for ex in batch]
+        ids_b = [ids_cache[ex.text_b] if ex.text_b else empty_ids for ex in batch]
+        offsets_a = np.zeros(len(batch) + 1, dtype=np.int64)
+        offsets_b = np.zeros(len(batch) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in ids_a], out=offsets_a[1:])
+        np.cumsum([len(ids) for ids in ids_b], out=offsets_b[1:])
+        has_b = np.array([bool(ex.text_b) for ex in batch])
+
+        batch_end = batch_start + len(batch)
+        _build_features(
+            np.concatenate(ids_a),
+            offsets_a,
+            np.concatenate(ids_b),
+            offsets_b,
+            has_b,
+            max_seq_length - pair_special_tokens_count,
+            max_seq_length - single_special_tokens_count,
+            bos_id,
+            eos_id,
+            cls_id,
+            sep_extra_id,
+            cls_token_at_end,
+            cls_token_segment_id,
+            sequence_a_segment_id,
+            sequence_b_segment_id,
+            pad_on_left,
+            1 if mask_padding_with_zero else 0,
+            all_input_ids[batch_start:batch_end],
+            all_segment_ids[batch_start:batch_end],
+            all_input_mask[batch_start:batch_end],
+        )
+
+    return all_input_ids, all_segment_ids, all_input_mask, all_label_ids
+
+
+def _build_labels(examples, label_list, output_mode):
+    """Returns the label ids of classification examples as int64 (as expected
+    by the cross entropy loss) or the float32 targets of regression examples
+    """
+    if output_mode == "classification":
+        label_map = {label: i for i, label in enumerate(label_list)}
+        return np.fromiter((label_map[example.label] for example in examples), np.int64, count=len(examples))
+    elif output_mode == "regression":
+        return np.fromiter((float(example.label) for example in examples), np.float32, count=len(examples))
+    else:
+        raise KeyError(output_mode)
+
+
+# numba's parallel mode is not used here: its threads make later forks of the
+# process (e.g. data loader workers) hang. Large example lists are instead
+# split between processes by convert_examples_to_features.
+@njit(cache=True)
+def _build_features(
+    ids_a,
+    offsets_a,
+    ids_b,
+    offsets_b,
+    has_b,
+    max_pair_length,
+    max_single_length,
+    bos_id,
+    eos_id,
+    cls_id,
+    sep_extra_id,
+    cls_token_at_end,
+    cls_token_segment_id,
+    sequence_a_segment_id,
+    sequence_b_segment_id,
+    pad_on_left,
+    mask_value,
+    input_ids,
+    segment_ids,
+    input_mask,
+):
+    """Writes the token ids of each example, truncated and surrounded by
+    the special tokens, into the pre-padded rows of input_ids, segment_ids
+    and input_mask. Special tokens with id -1 are not used.
     """
-    while True:
-        total_length = len(tokens_a) + len(tokens_b)
-        if total_length <= max_length:
-            break
-        if len(tokens_a) > len(tokens_b):
-            tokens_a.pop()
+    max_seq_length = input_ids.shape[1]
+    for i in range(input_ids.shape[0]):
+        len_a = offsets_a[i + 1] - offsets_a[i]
+        len_b = offsets_b[i + 1] - offsets_b[i]
+        if has_b[i]:
+            len_a, len_b = _truncated_lengths(len_a, len_b, max_pair_length)
         else:
-            tokens_b.pop()
+            len_a = min(len_a, max_single_length)
 
+        seq_length = len_a
+        seq_length += (1 if bos_id >= 0 else 0) + (1 if eos_id >= 0 else 0) + (1 if cls_id >= 0 else 0)
+        if len_b > 0:
+            seq_length += len_b + (1 if sep_extra_id >= 0 else 0)
+            seq_length += (1 if bos_id >= 0 else 0) + (1 if eos_id >= 0 else 0)
+        pos = max_seq_length - seq_length if pad_on_left else 0
+        input_mask[i, pos : pos + seq_length] = mask_value
 
-class InputFeatures(object):
-    """A single set of features of data."""
+        # [CLS] + <BOS> + A + <EOS> + [SEP_EXTRA] + <BOS> + B + <EOS>
+        # with [CLS] moved to the end if cls_token_at_end
+        if cls_id >= 0 and not cls_token_at_end:
+            input_ids[i, pos] = cls_id
+            segment_ids[i, pos] = cls_token_segment_id
+            pos += 1
+        if bos_id >= 0:
+            input_ids[i, pos] = bos_id
+            segment_ids[i, pos] = sequence_a_segment_id
+            pos += 1
+        input_ids[i, pos : pos + len_a] = ids_a[offsets_a[i] : offsets_a[i] + len_a]
+        segment_ids[i, pos : pos + len_a] = sequence_a_segment_id
+        pos += len_a
+        if eos_id >= 0:
+            input_ids[i, pos] = eos_id
+            segment_ids[i, pos] = sequence_a_segment_id
+            pos += 1
+
+        if len_b > 0:
+            if sep_extra_id >= 0:
+                input_ids[i, pos] = sep_extra_id
+                segment_ids[i, pos] = sequence_a_segment_id
+                pos += 1
+            if bos_id >= 0:
+                input_ids[i, pos] = bos_id
+                segment_ids[i, pos] = sequence_b_segment_id
+                pos += 1
+            input_ids[i, pos : pos + len_b] = ids_b[offsets_b[i] : offsets_b[i] + len_b]
+            segment_ids[i, pos : pos + len_b] = sequence_b_segment_id
+            pos += len_b
+            if eos_id >= 0:
+                input_ids[i, pos] = eos_id
+                segment_ids[i, pos] = sequence_b_segment_id
+                pos += 1
+
+        if cls_id >= 0 and cls_token_at_end:
+            input_ids[i, pos] = cls_id
+            segment_ids[i, pos] = cls_token_segment_id
+
+
+@njit(cache=True)
+def _truncated_lengths(len_a, len_b, max_length):
+    """Returns the lengths of a sequence pair truncated to the maximum length.
+
+     This will always truncate the longer sequence (the second one on ties).
+     This makes more sense than truncating an equal percent
+     of tokens from each, since if one sequence is very short then each token
+     that's truncated likely contains more information than a longer sequence.
+    """
+    overflow = len_a + len_b - max_length
+    if overflow <= 0:
+        return len_a, len_b
 
-    def __init__(self, input_ids, input_mask, segment_ids, label_id):
-        self.input_ids = input_ids
-        self.input_mask = input_mask
-        self.segment_ids = segment_ids
-        self.label_id = label_id
+    # Compute the final lengths in closed form instead of popping one token
+    # at a time: first the longer sequence is cut down to the length of the
+    # shorter one, then both are cut alternately, starting with the second one
+    if len_a > len_b:
+        num_removed = min(overflow, len_a - len_b)
+        len_a -= num_removed
+    else:
+        num_removed = min(overflow, len_b - len_a)
+        len_b -= num_removed
+    overflow -= num_removed
+    len_b -= (overflow + 1) // 2
+    len_a -= overflow // 2
+    return len_a, len_b
@@ -69,6 +69,20 @@ class SentencePieceTokenizer(TokenizerSpec):
         ids.extend(self.tokenizer.encode_as_ids(text[idx:]))
         return ids
 
+    def text_to_ids_batch(self, texts):
+        # texts without special tokens are encoded with a single
+        # SentencePiece call, the rest go through text_to_ids
+        plain_idx = [i for i, text in enumerate(texts) if not any(token in text for token in self.special_tokens)]
+        plain_ids = self.tokenizer.encode([texts[i] for i in plain_idx])
+
+        ids = [None] * len(texts)
+        for i, text_ids in zip(plain_idx, plain_ids):
+            ids[i] = text_ids
+        for i, text in enumerate(texts):
+            if ids[i] is None:
+                ids[i] = self.text_to_ids(text)
+        return ids
+
     def ids_to_text(self, ids):
         text = ""
         last_i = 0
@@ -23,6 +23,9 @@ class TokenizerSpec(ABC):
     def text_to_ids(self, text):
         pass
 
+    def text_to_ids_batch(self, texts):
+        return [self.text_to_ids(text) for text in texts]
+
     @abstractmethod
     def ids_to_text(self, ids):
         pass
@@ -142,4 +142,6 @@ class BERT(TrainableNM):
         return pretrained_models
 
     def forward(self, input_ids, token_type_ids, attention_mask):
+        # data layers may provide narrower integer types to save memory
+        input_ids, token_type_ids, attention_mask = input_ids.long(), token_type_ids.long(), attention_mask.long()
         return self.bert(input_ids, token_type_ids=token_type_ids, attention_mask=attention_mask,)[0]
@@ -0,0 +1,238 @@
+# ! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import csv
+import glob
+import multiprocessing
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import torch
+
+from nemo.collections.nlp import SentencePieceTokenizer
+from nemo.collections.nlp.data.datasets import glue
+from nemo.collections.nlp.data.datasets.glue import (
+    FEATURE_NAMES,
+    MIN_EXAMPLES_FOR_MULTIPROCESSING,
+    GLUEDataset,
+    _truncated_lengths,
+    convert_examples_to_features,
+)
+from nemo.collections.nlp.data.datasets.utils import InputExample, MrpcProcessor
+from tests.common_setup import NeMoUnitTest
+
+
+class TestGLUE(NeMoUnitTest):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.special_tokens = ["[CLS]", "[SEP]", "[PAD]"]
+        cls.tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
+        cls.tokenizer.add_special_tokens(cls.special_tokens)
+
+    @staticmethod
+    def write_mrpc_data(data_dir):
+        rows = [
+            ("1", "the quick brown fox", "jumps over the lazy dog"),
+            ("0", "hello world", "the dog sleeps"),
+            ("1", "a b c d e f g h i j k l m n o p", "q r s t u v w x y z"),
+        ]
+        with open(os.path.join(data_dir, "train.tsv"), "w") as f:
+            writer = csv.writer(f, delimiter="\t")
+            writer.writerow(["Quality", "#1 ID", "#2 ID", "#1 String", "#2 String"])
+            for i, (label, text_a, text_b) in enumerate(rows):
+                writer.writerow([label, 2 * i, 2 * i + 1, text_a, text_b])
+
+    def create_dataset(self, data_dir, tokenizer):
+        return GLUEDataset(
+            data_dir, tokenizer, 16, MrpcProcessor(), "classification", evaluate=False, token_params={}, use_cache=True
+        )
+
+    def convert(self, text_a, text_b, max_seq_length, **token_params):
+        examples = [InputExample(guid="0", text_a=text_a, text_b=text_b, label="1")]
+        features = convert_examples_to_features(
+            examples, ["0", "1"], max_seq_length, self.tokenizer, "classification", **token_params
+        )
+        input_ids, segment_ids, input_mask, label_ids = [array.tolist() for array in features]
+        self.assertEqual(label_ids, [1])
+        return input_ids[0], segment_ids[0], input_mask[0]
+
+    def test_convert_examples_to_features(self):
+        # "hello world" is tokenized as [373, 13291, 1029],
+        # "the dog sleeps" as [23, 11227, 11316, 32647]
+        cls, sep, pad = self.tokenizer.tokens_to_ids(self.special_tokens)
+
+        input_ids, segment_ids, input_mask = self.convert("hello world", "the dog sleeps", 12)
+        self.assertEqual(input_ids, [cls, 373, 13291, 1029, sep, 23, 11227, 11316, 32647, sep, pad, pad])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 0, 0])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0])
+
+        input_ids, segment_ids, input_mask = self.convert("hello world", None, 8)
+        self.assertEqual(input_ids, [cls, 373, 13291, 1029, sep, pad, pad, pad])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 0, 0, 0])
+
+    def test_convert_examples_to_features_bos_eos(self):
+        bos, eos = self.tokenizer.tokens_to_ids(["<s>", "</s>"])
+        pad = self.tokenizer.tokens_to_ids(["[PAD]"])[0]
+
+        input_ids, segment_ids, input_mask = self.convert(
+            "hello world", "the dog sleeps", 12, bos_token="<s>", eos_token="</s>", cls_token=None
+        )
+        self.assertEqual(input_ids, [bos, 373, 13291, 1029, eos, bos, 23, 11227, 11316, 32647, eos, pad])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 0])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0])
+
+    def test_convert_examples_to_features_sep_token_extra(self):
+        cls, sep, pad = self.tokenizer.tokens_to_ids(self.special_tokens)
+
+        input_ids, segment_ids, input_mask = self.convert("hello world", "the dog sleeps", 12, sep_token_extra="[SEP]")
+        self.assertEqual(input_ids, [cls, 373, 13291, 1029, sep, sep, 23, 11227, 11316, 32647, sep, pad])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 0])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0])
+
+    def test_convert_examples_to_features_cls_token_at_end(self):
+        cls, sep, pad = self.tokenizer.tokens_to_ids(self.special_tokens)
+
+        input_ids, segment_ids, input_mask = self.convert(
+            "hello world", "the dog sleeps", 12, cls_token_at_end=True, cls_token_segment_id=2
+        )
+        self.assertEqual(input_ids, [373, 13291, 1029, sep, 23, 11227, 11316, 32647, sep, cls, pad, pad])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 1, 1, 1, 1, 1, 2, 0, 0])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0])
+
+    def test_convert_examples_to_features_pad_on_left(self):
+        cls, sep, pad = self.tokenizer.tokens_to_ids(self.special_tokens)
+
+        input_ids, segment_ids, input_mask = self.convert(
+            "hello world",
+            "the dog sleeps",
+            12,
+            cls_token_at_end=True,
+            cls_token_segment_id=2,
+            pad_on_left=True,
+            pad_token_segment_id=4,
+        )
+        self.assertEqual(input_ids, [pad, pad, 373, 13291, 1029, sep, 23, 11227, 11316, 32647, sep, cls])
+        self.assertEqual(segment_ids, [4, 4, 0, 0, 0, 0, 1, 1, 1, 1, 1, 2])
+        self.assertEqual(input_mask, [0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1])
+
+    def test_convert_examples_to_features_truncation(self):
+        # "a b c d e f g h i j" is tokenized as
+        # [7, 25, 41, 9, 35, 30, 79, 43, 291, 235]
+        cls, sep, pad = self.tokenizer.tokens_to_ids(self.special_tokens)
+
+        input_ids, segment_ids, input_mask = self.convert("a b c d e f g h i j", None, 8)
+        self.assertEqual(input_ids, [cls, 7, 25, 41, 9, 35, 30, sep])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 1, 1, 1])
+
+        input_ids, segment_ids, input_mask = self.convert("hello world", "a b c d e f g h i j", 12)
+        self.assertEqual(input_ids, [cls, 373, 13291, 1029, sep, 7, 25, 41, 9, 35, 30, sep])
+        self.assertEqual(segment_ids, [0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1])
+        self.assertEqual(input_mask, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1])
+
+    def test_convert_examples_to_features_max_seq_length(self):
+        cls, sep, pad = self.tokenizer.tokens_to_ids(self.special_tokens)
+
+        input_ids, segment_ids, input_mask = self.convert("hello world", None, 2)
+        self.assertEqual(input_ids, [cls, sep])
+
+        with self.assertRaises(ValueError):
+            self.convert("hello world", None, 1)
+        with self.assertRaises(ValueError):
+            self.convert("hello world", "the dog sleeps", 2)
+
+    def test_convert_examples_to_features_num_workers(self):
+        texts = ["hello world", "the dog sleeps", "a b c d e f g h i j", "the quick brown fox"]
+        examples = [
+            InputExample(
+                guid=str(i), text_a=texts[i % 4], text_b=texts[i // 4 % 4] if i % 3 else None, label=str(i % 2)
+            )
+            for i in range(MIN_EXAMPLES_FOR_MULTIPROCESSING)
+        ]
+        features = convert_examples_to_features(
+            examples, ["0", "1"], 12, self.tokenizer, "classification", num_workers=1
+        )
+        with mock.patch.object(
+            glue, "_convert_examples_to_features_parallel", wraps=glue._convert_examples_to_features_parallel
+        ) as convert_parallel:
+            parallel_features = convert_examples_to_features(
+                examples, ["0", "1"], 12, self.tokenizer, "classification", num_workers=2
+            )
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            self.assertTrue(convert_parallel.called)
+        for array, parallel_array in zip(features, parallel_features):
+            self.assertEqual(array.dtype, parallel_array.dtype)
+            self.assertTrue(np.array_equal(array, parallel_array))
+
+    def test_glue_dataset_cache(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.write_mrpc_data(data_dir)
+            dataset = self.create_dataset(data_dir, self.tokenizer)
+            self.assertEqual(len(glob.glob(os.path.join(data_dir, "cache_glue_*.npy"))), len(FEATURE_NAMES))
+
+            with mock.patch.object(glue, "_convert_examples_to_features", side_effect=AssertionError):
+                cached_dataset = self.create_dataset(data_dir, self.tokenizer)
+
+            self.assertEqual(len(cached_dataset), len(dataset))
+            for i in range(len(dataset)):
+                for tensor, cached_tensor in zip(dataset[i], cached_dataset[i]):
+                    self.assertTrue(torch.equal(tensor, cached_tensor))
+
+    def test_glue_dataset_cache_key_special_tokens(self):
+        # tokenizers that only differ in the ids of the special tokens
+        # must not share the cached features
+        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
+        tokenizer.add_special_tokens(self.special_tokens[::-1])
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.write_mrpc_data(data_dir)
+            self.create_dataset(data_dir, self.tokenizer)
+            dataset = self.create_dataset(data_dir, tokenizer)
+
+            self.assertEqual(len(glob.glob(os.path.join(data_dir, "cache_glue_*.npy"))), 2 * len(FEATURE_NAMES))
+            self.assertEqual(dataset[0][0][0].item(), tokenizer.tokens_to_ids(["[CLS]"])[0])
+
+    def test_glue_dataset_cache_save_failure(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.write_mrpc_data(data_dir)
+            with mock.patch.object(glue, "_save_features", side_effect=OSError):
+                dataset = self.create_dataset(data_dir, self.tokenizer)
+
+            self.assertEqual(len(dataset), 3)
+            self.assertEqual(glob.glob(os.path.join(data_dir, "cache_glue_*")), [])
+
+    def test_truncated_lengths(self):
+        def truncate_greedy(tokens_a, tokens_b, max_length):
+            while len(tokens_a) + len(tokens_b) > max_length:
+                if len(tokens_a) > len(tokens_b):
+                    tokens_a.pop()
+                else:
+                    tokens_b.pop()
+
+        for len_a in range(10):
+            for len_b in range(10):
+                for max_length in range(20):
+                    tokens_a, tokens_b = list(range(len_a)), list(range(len_b))
+                    truncate_greedy(tokens_a, tokens_b, max_length)
+
+                    self.assertEqual(_truncated_lengths(len_a, len_b, max_length), (len(tokens_a), len(tokens_b)))
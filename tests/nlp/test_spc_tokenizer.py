@@ -21,90 +21,92 @@ from tests.common_setup import NeMoUnitTest
 
 
 class TestSPCTokenizer(NeMoUnitTest):
-    def test_add_special_tokens(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        # Loading the model is slow, so the tokenizers are shared by all tests
+        cls.special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
+        cls.tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
+        cls.tokenizer.add_special_tokens(cls.special_tokens)
+        cls.plain_tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
 
-        special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
-        tokenizer.add_special_tokens(special_tokens)
+    def test_add_special_tokens(self):
+        tokenizer = self.tokenizer
 
-        self.assertTrue(tokenizer.vocab_size == tokenizer.original_vocab_size + len(special_tokens))
+        self.assertEqual(tokenizer.vocab_size, tokenizer.original_vocab_size + len(self.special_tokens))
 
     def test_text_to_tokens(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
-
-        special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
-        tokenizer.add_special_tokens(special_tokens)
+        tokenizer = self.tokenizer
 
         text = "[CLS] a b c [MASK] e f [SEP] g h i [SEP]"
         tokens = tokenizer.text_to_tokens(text)
 
-        self.assertTrue(len(tokens) == len(text.split()))
-        self.assertTrue(tokens.count("[CLS]") == 1)
-        self.assertTrue(tokens.count("[MASK]") == 1)
-        self.assertTrue(tokens.count("[SEP]") == 2)
+        self.assertEqual(len(tokens), len(text.split()))
+        self.assertEqual(tokens.count("[CLS]"), 1)
+        self.assertEqual(tokens.count("[MASK]"), 1)
+        self.assertEqual(tokens.count("[SEP]"), 2)
 
     def test_tokens_to_text(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
+        tokenizer = self.plain_tokenizer
 
         text = "[CLS] a b c [MASK] e f [SEP] g h i [SEP]"
         tokens = tokenizer.text_to_tokens(text)
         result = tokenizer.tokens_to_text(tokens)
 
-        self.assertTrue(text == result)
+        self.assertEqual(text, result)
 
     def test_text_to_ids(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
-
-        special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
-        tokenizer.add_special_tokens(special_tokens)
+        tokenizer = self.tokenizer
 
         text = "[CLS] a b c [MASK] e f [SEP] g h i [SEP]"
         ids = tokenizer.text_to_ids(text)
 
-        self.assertTrue(len(ids) == len(text.split()))
-        self.assertTrue(ids.count(tokenizer.special_tokens["[CLS]"]) == 1)
-        self.assertTrue(ids.count(tokenizer.special_tokens["[MASK]"]) == 1)
-        self.assertTrue(ids.count(tokenizer.special_tokens["[SEP]"]) == 2)
+        self.assertEqual(len(ids), len(text.split()))
+        self.assertEqual(ids.count(tokenizer.special_tokens["[CLS]"]), 1)
+        self.assertEqual(ids.count(tokenizer.special_tokens["[MASK]"]), 1)
+        self.assertEqual(ids.count(tokenizer.special_tokens["[SEP]"]), 2)
 
-    def test_ids_to_text(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
+    def test_text_to_ids_batch(self):
+        tokenizer = self.tokenizer
+
+        texts = ["[CLS] a b c [MASK] e f [SEP] g h i [SEP]", "a b c", ""]
+        ids = tokenizer.text_to_ids_batch(texts)
 
-        special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
-        tokenizer.add_special_tokens(special_tokens)
+        self.assertEqual(len(ids), len(texts))
+
+        for i in range(len(texts)):
+            self.assertEqual(ids[i], tokenizer.text_to_ids(texts[i]))
+
+    def test_ids_to_text(self):
+        tokenizer = self.tokenizer
 
         text = "[CLS] a b c [MASK] e f [SEP] g h i [SEP]"
         ids = tokenizer.text_to_ids(text)
         result = tokenizer.ids_to_text(ids)
 
-        self.assertTrue(text == result)
+        self.assertEqual(text, result)
 
     def test_tokens_to_ids(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
-
-        special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
-        tokenizer.add_special_tokens(special_tokens)
+        tokenizer = self.tokenizer
 
         text = "[CLS] a b c [MASK] e f [SEP] g h i [SEP]"
         tokens = tokenizer.text_to_tokens(text)
         ids = tokenizer.tokens_to_ids(tokens)
 
-        self.assertTrue(len(ids) == len(tokens))
-        self.assertTrue(ids.count(tokenizer.special_tokens["[CLS]"]) == 1)
-        self.assertTrue(ids.count(tokenizer.special_tokens["[MASK]"]) == 1)
-        self.assertTrue(ids.count(tokenizer.special_tokens["[SEP]"]) == 2)
+        self.assertEqual(len(ids), len(tokens))
+        self.assertEqual(ids.count(tokenizer.special_tokens["[CLS]"]), 1)
+        self.assertEqual(ids.count(tokenizer.special_tokens["[MASK]"]), 1)
+        self.assertEqual(ids.count(tokenizer.special_tokens["[SEP]"]), 2)
 
     def test_ids_to_tokens(self):
-        tokenizer = SentencePieceTokenizer("./tests/data/m_common.model")
-
-        special_tokens = ["[CLS]", "[MASK]", "[SEP]"]
-        tokenizer.add_special_tokens(special_tokens)
+        tokenizer = self.tokenizer
 
         text = "[CLS] a b c [MASK] e f [SEP] g h i [SEP]"
         tokens = tokenizer.text_to_tokens(text)
         ids = tokenizer.tokens_to_ids(tokens)
         result = tokenizer.ids_to_tokens(ids)
 
-        self.assertTrue(len(result) == len(tokens))
+        self.assertEqual(len(result), len(tokens))
 
         for i in range(len(result)):
-            self.assertTrue(result[i] == tokens[i])
+            self.assertEqual(result[i], tokens[i])